@@ -0,0 +1,64 @@
+import json
+import os
+
+from config import CACHE_DIR
+from jdm_client import ARCHIVE_DATA, ARCHIVE_INDEX, CacheArchive
+
+# regroupe les fichiers par mot du cache dans cache.pack + cache.idx, puis les supprime
+# les anciens fichiers a plat ne sont pas archives : deja lus directement, ils seraient stockes deux fois
+FORMATS = {".json": "json", ".mp": "mp"}
+
+
+def compact(cache_dir=CACHE_DIR, progress=True):
+    old = CacheArchive(cache_dir)
+    index = {"words": {}}
+    data_path = os.path.join(cache_dir, ARCHIVE_DATA)
+    index_path = os.path.join(cache_dir, ARCHIVE_INDEX)
+    packed = []
+
+    with open(data_path + ".tmp", "wb") as out:
+        def put(key, raw, fmt):
+            index["words"][key] = [out.tell(), len(raw), fmt]
+            out.write(raw)
+
+        # fichiers par mot (cache/<2 car.>/<md5>.mp|.json) : plus recents que l'archive
+        with os.scandir(cache_dir) as shards:
+            shard_dirs = sorted(e.path for e in shards if e.is_dir() and len(e.name) == 2)
+        for shard in shard_dirs:
+            with os.scandir(shard) as files:
+                # .mp avant .json, comme a la lecture
+                names = sorted((e.name for e in files if e.is_file()), key=lambda n: n.endswith(".json"))
+            for name in names:
+                key, ext = os.path.splitext(name)
+                fmt = FORMATS.get(ext)
+                if fmt is None:
+                    continue
+                path = os.path.join(shard, name)
+                if key not in index["words"]:
+                    with open(path, "rb") as f:
+                        put(key, f.read(), fmt)
+                packed.append(path)
+        for key in old.words:
+            if key not in index["words"]:
+                put(key, *old.read(key))
+
+    old.close()
+    with open(index_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(data_path + ".tmp", data_path)
+    os.replace(index_path + ".tmp", index_path)
+    for path in packed:
+        os.remove(path)
+    # sous-dossiers vides une fois leurs fichiers archives
+    for shard in shard_dirs:
+        if not os.listdir(shard):
+            os.rmdir(shard)
+
+    if progress:
+        size = os.path.getsize(data_path) / 1e6
+        print(f"  Archive : {len(index['words'])} mots, {size:.0f} Mo")
+    return index
+
+
+if __name__ == "__main__":
+    compact()
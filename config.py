@@ -5,6 +5,7 @@ JDM_API_BASE = "https://jdm-api.demo.lirmm.fr/v0"
 #Chemins
 LEARN_DIR = "Learn/"
 CACHE_DIR = "cache/"
+MODEL_PATH = "model.pkl"  # Modele appris sauvegarde (recharge si meme jeu d'apprentissage)
 
 # Mapping : nom du fichier corpus -> ID de la relation JDM correspondante
 RELATION_TYPES = {
@@ -87,3 +88,7 @@ TRAIN_RATIO = 0.8
 RANDOM_SEED = 42
 API_RATE_LIMIT = 0.05   # Secondes entre les appels API (50ms)
 API_REQUEST_LIMIT = 200  # Nombre max de relations par requete
+PREFETCH_CONCURRENCY = 16  # Requetes API simultanees au prefetch
+MEMORY_CACHE_SIZE = 20000  # Mots gardes en memoire par le client JDM (LRU)
+CACHE_MAX_AGE = 30 * 24 * 3600  # Age (s) au-dela duquel une entree du cache est revalidee si demande
+EXTRACT_WORKERS = 16     # Threads pour l'extraction des signatures a l'apprentissage
@@ -1,32 +1,50 @@
 import json
 import os
 import random
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from config import LEARN_DIR, RANDOM_SEED, TRAIN_RATIO
 
+# orjson si disponible (parse directement les bytes, plus rapide), sinon json standard
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+
+def load_file(learn_dir, filename):
+    relation_type = filename.replace(".json", "")
+    filepath = os.path.join(learn_dir, filename)
+    with open(filepath, "rb") as f:
+        examples = json_loads(f.read())
+    pairs = []
+    for ex in examples:
+        a = ex.get("A", "").strip()
+        b = ex.get("B", "").strip()
+        if a and b:
+            pairs.append((a, b, relation_type))
+    return pairs
+
 #Json apprentissage -> {A,B,Relation}
+# fichiers lus en parallèle, concaténés dans l'ordre trié des noms (déterministe)
 def load_corpus(learn_dir=LEARN_DIR):
+    filenames = [f for f in sorted(os.listdir(learn_dir)) if f.endswith(".json")]
     corpus = []
-    for filename in sorted(os.listdir(learn_dir)):
-        if not filename.endswith(".json"):
-            continue
-        relation_type = filename.replace(".json", "")
-        filepath = os.path.join(learn_dir, filename)
-        with open(filepath, "r", encoding="utf-8") as f:
-            examples = json.load(f)
-        for ex in examples:
-            a = ex.get("A", "").strip()
-            b = ex.get("B", "").strip()
-            if a and b:
-                corpus.append((a, b, relation_type))
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        for pairs in pool.map(lambda f: load_file(learn_dir, f), filenames):
+            corpus.extend(pairs)
     return corpus
 
 # split 80/20 ( Inutile actuellement, fait juste perdre 20% de notre jeu de données, on l'utilisait pour la partie d'évaluation)
 def split_train_test(corpus, train_ratio=TRAIN_RATIO, seed=RANDOM_SEED):
     rng = random.Random(seed)
 
-    by_type = {}
-    for a, b, rt in corpus:
-        by_type.setdefault(rt, []).append((a, b, rt))
+    # corpus déjà sous forme (a, b, rt) : on regroupe les tuples tels quels, sans les recréer.
+    # Les mélanges restent identiques (même graine -> même découpage qu'avant)
+    by_type = defaultdict(list)
+    for ex in corpus:
+        by_type[ex[2]].append(ex)
 
     train_set = []
     test_set = []
@@ -1,12 +1,35 @@
+import hashlib
+import heapq
 import math
+import os
+import pickle
+from operator import itemgetter
 from dataclasses import dataclass, field
-from collections import defaultdict
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
 
+from config import EXTRACT_WORKERS, API_REQUEST_LIMIT
+from signature import TRT_TYPES
+
+# paquet de règles d'un même type et de tailles voisines (|sL|, |sR| dans [lo, hi]),
+# stocké en colonnes
 @dataclass
-class Rule:
-    sL: set = field(default_factory=set)
-    sR: set = field(default_factory=set)
-    rt: str = ""
+class RuleGroup:
+    lo_L: int = 0
+    hi_L: int = 0
+    lo_R: int = 0
+    hi_R: int = 0
+    ids: list = field(default_factory=list)
+    rows_L: list = field(default_factory=list)
+    rows_R: list = field(default_factory=list)
+    norm_L: list = field(default_factory=list)
+    norm_R: list = field(default_factory=list)
+    # union des bitsets du groupe : |q ∩ r| <= |q ∩ union|
+    union_L: int = 0
+    union_R: int = 0
+
+# règle = (sL, sR, rt), stockée en colonnes dans GRASPit (rules_sL, rules_sR, rules_rt)
 # degats de la tempete : 
 # Sl = Signature(Degats)(set) = [h:Dommages ; h:destruction : ; type_semantique : A ; regle_existante : regle]
 # sR = Signature (tempete)(set)
@@ -21,73 +44,364 @@ def cosine_sim(s1, s2):
     return len(intersection) / (math.sqrt(len(s1)) * math.sqrt(len(s2)))
 # Degats : 25 termes , destruction : 37 , intersection : 22 
 # score 22 / (racine(25)*racine(37)
+# même cosinus sur bitsets (q_norm, norm = racines des cardinaux)
+def _sim_bits(q, row, q_norm, norm):
+    return (q & row).bit_count() / (q_norm * norm) if norm else 0.0
+
+# noyau de scoring : une seule passe sur les deux côtés de toutes les règles
+# |A ∩ B| = popcount(A & B), normes des règles précalculées à l'apprentissage ;
+# même forme que cosine_sim (len / (n1 * n2), puis moyenne) pour garder les égalités exactes
+def score_all(rows_l, rows_r, norms_l, norms_r, q_l, q_r, qn_l, qn_r):
+    return [(((q_l & rl).bit_count() / (qn_l * nl) if nl else 0.0)
+             + ((q_r & rr).bit_count() / (qn_r * nr) if nr else 0.0)) / 2.0
+            for rl, rr, nl, nr in zip(rows_l, rows_r, norms_l, norms_r)]
+
+# indices des k meilleurs scores, par score décroissant (ordre d'origine en cas d'égalité)
+# sélection du k-ième score sans clé, puis tri des seuls gagnants
+def top_k(scores, k):
+    if k <= 0 or not scores:
+        return []
+    tau = heapq.nlargest(k, scores)[-1]
+    idx = [i for i, s in enumerate(scores) if s >= tau]
+    idx.sort(key=scores.__getitem__, reverse=True)
+    return idx[:k]
+
+# même score via l'index inversé feature -> règles : seules les règles partageant
+# au moins une feature avec la requête sont touchées (les autres valent 0)
+def score_postings(post_l, post_r, norms_l, norms_r, ids_l, ids_r, qn_l, qn_r):
+    count_l = Counter(chain.from_iterable([post_l[f] for f in ids_l if f in post_l]))
+    count_r = Counter(chain.from_iterable([post_r[f] for f in ids_r if f in post_r]))
+    # une règle candidate a forcément une norme non nulle du côté où elle est comptée
+    sims = {i: c / (qn_l * norms_l[i]) for i, c in count_l.items()}
+    for i, c in count_r.items():
+        sims[i] = sims.get(i, 0.0) + c / (qn_r * norms_r[i])
+    return {i: s / 2.0 for i, s in sims.items()}
+
+# top_k sur les scores creux : les candidats ont tous un score > 0, on complète
+# si besoin avec les premières règles non candidates (score 0) comme le ferait top_k
+def top_k_postings(scores, k, n):
+    if k <= 0:
+        return []
+    idx = []
+    if scores:
+        tau = heapq.nlargest(k, scores.values())[-1]
+        idx = sorted(i for i, s in scores.items() if s >= tau)
+        idx.sort(key=scores.__getitem__, reverse=True)
+        idx = idx[:k]
+    i = 0
+    while len(idx) < k and i < n:
+        if i not in scores:
+            idx.append(i)
+        i += 1
+    return idx
+
+# borne de Cauchy-Schwarz d'un côté pour des règles de taille s dans [lo, hi] :
+# |q ∩ r| <= min(m, s) avec m = |q ∩ union du groupe|, donc
+# cos <= min(m, s) / (q_norm * sqrt(s)), maximal pour s le plus proche de m
+def side_bound(m, q_norm, lo, hi):
+    s = min(max(m, lo), hi)
+    return min(m, s) / (q_norm * math.sqrt(s)) if s else 0.0
+
+# largeur des tranches de taille pour regrouper les règles d'un même type
+SIZE_BUCKET = 8
+# marge sur la borne (arrondis flottants) : un groupe n'est ignoré que s'il est
+# strictement sous le k-ième score, l'ordre des égalités reste celui de top_k
+BOUND_EPS = 1e-9
+
+# au-delà de ce volume de postings (par règle), le parcours dense des bitsets est plus rapide
+POSTINGS_MAX_RATIO = 1
+
+# version du format sauvegardé : à incrémenter dès qu'un changement de code modifie
+# le contenu ou le sens des tableaux de MODEL_STATE (les anciens model.pkl sont alors ignorés)
+MODEL_VERSION = 2
+
+# état appris sauvegardé sur disque (tout sauf l'extracteur et les caches par mot)
+MODEL_STATE = (
+    "vocab", "rules_sL", "rules_sR", "rules_rt", "rules_nL", "rules_nR",
+    "rows_L", "rows_R", "post_L", "post_R",
+    "rt2id", "id2rt", "rule_rt_ids", "groups",
+)
+
 # modèle GRASPIT , classification par proches voisins
 class GRASPit:
     def __init__(self, extractor, k=5):
         self.extractor = extractor
         self.k = k # à tester avec autres k 
-        self.rules = []
+        # règles en colonnes (struct of arrays) : la règle i est (rules_sL[i], rules_sR[i], rules_rt[i])
+        # rules_nL / rules_nR : racines des cardinaux de sL / sR, calculées une fois à l'apprentissage
+        self.rules_sL = []
+        self.rules_sR = []
+        self.rules_rt = []
+        self.rules_nL = []
+        self.rules_nR = []
+        # matrice règles x features : une ligne = bitset des features d'un côté de la règle
+        self.vocab = {}
+        self.rows_L = []
+        self.rows_R = []
+        # index inversé : id de feature -> indices des règles qui la contiennent
+        self.post_L = {}
+        self.post_R = {}
+        # types de relation -> petits entiers (votes dans une liste de taille fixe)
+        self.rt2id = {}
+        self.id2rt = []
+        self.rule_rt_ids = []
+        self.groups = []
+        # mot -> (bitset, norme) de la requête, dépend du vocabulaire donc vidé à chaque train
+        self._query_cache = {}
     #stockage règles corpus
-    def train(self, train_data):
-        self.rules = []
+    def train(self, train_data, workers=EXTRACT_WORKERS):
+        self.rules_sL = []
+        self.rules_sR = []
+        self.rules_rt = []
+        self.rules_nL = []
+        self.rules_nR = []
+        self.vocab = {}
+        self.rows_L = []
+        self.rows_R = []
+        post_L = defaultdict(list)
+        post_R = defaultdict(list)
+        self.rt2id = {}
+        self.id2rt = []
+        self.rule_rt_ids = []
+        self._query_cache = {}
+        # extraction des signatures en parallèle (I/O cache/API), une fois par mot distinct
+        words = list(dict.fromkeys(w for a, b, _ in train_data for w in (a, b)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(self._word_features, words))
         total = len(train_data)
-        for i, (a, b, rt) in enumerate(train_data):
-            set_a, set_b = self.extractor.extract_pair(a, b)
+        for a, b, rt in train_data:
+            set_a, set_b = self._memo_extract(a, b)
             #mot inconnu 
             if not set_a and not set_b:
                 continue
-            self.rules.append(Rule(sL=set_a, sR=set_b, rt=rt))
-            if i+1 == total:
-                print(f"  [{i+1}/{total}] Regles creees")
+            rule_id = len(self.rules_rt)
+            n_l, n_r = math.sqrt(len(set_a)), math.sqrt(len(set_b))
+            self.rules_sL.append(set_a)
+            self.rules_sR.append(set_b)
+            self.rules_rt.append(rt)
+            self.rules_nL.append(n_l)
+            self.rules_nR.append(n_r)
+            self.rows_L.append(self._intern(set_a, post_L, rule_id))
+            self.rows_R.append(self._intern(set_b, post_R, rule_id))
+            if rt not in self.rt2id:
+                self.rt2id[rt] = len(self.id2rt)
+                self.id2rt.append(rt)
+            self.rule_rt_ids.append(self.rt2id[rt])
+        if total:
+            print(f"  [{total}/{total}] Regles creees")
+        self.post_L = dict(post_L)
+        self.post_R = dict(post_R)
+        self.groups = self._build_groups()
+
+    # empreinte du jeu d'apprentissage et de ce qui fixe les signatures (nb d'hyperonymes,
+    # types TRT, limite des requêtes JDM) et la version du format : un modèle sauvegardé
+    # n'est rechargé que pour les mêmes données, les mêmes réglages et le même code
+    def _fingerprint(self, train_data):
+        settings = (MODEL_VERSION, getattr(self.extractor, "max_hyperonyms", None),
+                    sorted(TRT_TYPES), API_REQUEST_LIMIT)
+        h = hashlib.md5(repr(settings).encode("utf-8"))
+        for a, b, rt in train_data:
+            h.update(f"{a}\t{b}\t{rt}\n".encode("utf-8"))
+        return h.hexdigest()
+
+    # sauvegarde des tableaux appris : les lancements suivants évitent prefetch + extraction
+    # (supprimer le fichier pour forcer un réapprentissage, ex. après mise à jour du cache JDM)
+    def save(self, path, train_data):
+        state = {name: getattr(self, name) for name in MODEL_STATE}
+        state["fingerprint"] = self._fingerprint(train_data)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    def load(self, path, train_data):
+        if not os.path.exists(path):
+            return False
+        try:
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+        except Exception:
+            return False
+        # fichier d'une autre version ou incomplet : on réapprend plutôt que de planter
+        if not isinstance(state, dict) or state.get("fingerprint") != self._fingerprint(train_data):
+            return False
+        if any(name not in state for name in MODEL_STATE):
+            return False
+        for name in MODEL_STATE:
+            setattr(self, name, state[name])
+        self._query_cache = {}
+        return True
+
+    # règles regroupées par type de relation et tranches de taille (|sL|, |sR|),
+    # indices croissants dans chaque groupe
+    def _build_groups(self):
+        buckets = defaultdict(list)
+        for i, (rt_id, s_l, s_r) in enumerate(zip(self.rule_rt_ids, self.rules_sL, self.rules_sR)):
+            buckets[(rt_id, len(s_l) // SIZE_BUCKET, len(s_r) // SIZE_BUCKET)].append(i)
+        groups = []
+        for ids in buckets.values():
+            sizes_L = [len(self.rules_sL[i]) for i in ids]
+            sizes_R = [len(self.rules_sR[i]) for i in ids]
+            group = RuleGroup(
+                lo_L=min(sizes_L), hi_L=max(sizes_L), lo_R=min(sizes_R), hi_R=max(sizes_R),
+                ids=ids,
+                rows_L=[self.rows_L[i] for i in ids], rows_R=[self.rows_R[i] for i in ids],
+                norm_L=[self.rules_nL[i] for i in ids], norm_R=[self.rules_nR[i] for i in ids],
+            )
+            for row in group.rows_L:
+                group.union_L |= row
+            for row in group.rows_R:
+                group.union_R |= row
+            groups.append(group)
+        return groups
+
+    # parcours des groupes par borne décroissante ; dès que la borne d'un groupe passe
+    # sous le k-ième meilleur score courant (tau), aucun groupe restant ne peut entrer.
+    # Les k meilleures règles vues sont tenues dans un tas borné de (score, -indice) :
+    # heap[0] est le k-ième courant, mémoire O(k) en plus des scores du groupe en cours
+    # Pas de test de borne règle par règle : en Python il coûte autant que les deux
+    # popcounts qu'il éviterait, la coupure se fait donc au niveau des groupes
+    def _top_rules_pruned(self, q_l, qn_l, q_r, qn_r):
+        k = self.k
+        if k <= 0:
+            return [], []
+        bounds = [((side_bound((q_l & g.union_L).bit_count(), qn_l, g.lo_L, g.hi_L)
+                    + side_bound((q_r & g.union_R).bit_count(), qn_r, g.lo_R, g.hi_R)) / 2.0, g)
+                  for g in self.groups]
+        bounds.sort(key=itemgetter(0), reverse=True)
+        heap = []
+        for bound, g in bounds:
+            full = len(heap) == k
+            if full and bound + BOUND_EPS < heap[0][0]:
+                break
+            scores = score_all(g.rows_L, g.rows_R, g.norm_L, g.norm_R, q_l, q_r, qn_l, qn_r)
+            if full and max(scores) < heap[0][0]:
+                continue
+            for j in top_k(scores, k):
+                item = (scores[j], -g.ids[j])
+                if len(heap) < k:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+                else:
+                    break
+        heap.sort(reverse=True)
+        return [-i for _, i in heap], [score for score, _ in heap]
+
+    # une signature par mot, mise en cache par l'extracteur (ensemble figé mémorisé sur la signature)
+    def _word_features(self, word):
+        return self.extractor.extract(word).to_set()
+
+    def _memo_extract(self, a, b):
+        return self._word_features(a), self._word_features(b)
+
+    def _query(self, word):
+        query = self._query_cache.get(word)
+        if query is None:
+            features = self._word_features(word)
+            bits, ids = self._encode(features)
+            query = (bits, math.sqrt(len(features)) or 1.0, ids)
+            self._query_cache[word] = query
+        return query
+
+    # signature -> bitset (int python), bit i = feature d'id i
+    def _intern(self, features, postings, rule_id):
+        vocab = self.vocab
+        bits = 0
+        for f in features:
+            fid = vocab.setdefault(f, len(vocab))
+            bits |= 1 << fid
+            postings[fid].append(rule_id)
+        return bits
+
+    # features inconnues du vocabulaire : aucune intersection possible, on les ignore
+    def _encode(self, features):
+        vocab = self.vocab
+        bits = 0
+        ids = []
+        for f in features:
+            fid = vocab.get(f)
+            if fid is not None:
+                bits |= 1 << fid
+                ids.append(fid)
+        return bits, ids
+
+    # indices et scores des k meilleures règles (sélection O(N), sans tri complet)
+    def _top_rules(self, a, b):
+        q_l, qn_l, ids_l = self._query(a)
+        q_r, qn_r, ids_r = self._query(b)
+        n = len(self.rules_rt)
+        volume = (sum(len(self.post_L.get(f, ())) for f in ids_l)
+                  + sum(len(self.post_R.get(f, ())) for f in ids_r))
+        if volume < POSTINGS_MAX_RATIO * n:
+            scores = score_postings(self.post_L, self.post_R, self.rules_nL, self.rules_nR,
+                                    ids_l, ids_r, qn_l, qn_r)
+            top = top_k_postings(scores, self.k, n)
+            best = [scores.get(i, 0.0) for i in top]
+        else:
+            top, best = self._top_rules_pruned(q_l, qn_l, q_r, qn_r)
+        return top, best
 
     def score_r(self, a, b):
-        set_a, set_b = self.extractor.extract_pair(a, b)
-        scored = []
-        for rule in self.rules:
-            sim_l = cosine_sim(set_a, rule.sL)
-            sim_r = cosine_sim(set_b, rule.sR)
-            score = (sim_l + sim_r) / 2.0
-            scored.append((score, rule.rt, sim_l, sim_r))
-        scored.sort(key=lambda x: -x[0])
-        return scored
+        top, best = self._top_rules(a, b)
+        q_l, qn_l, _ = self._query(a)
+        q_r, qn_r, _ = self._query(b)
+        # sim_l / sim_r seulement recalculés pour les k gagnantes
+        return [(score, self.rules_rt[i],
+                 _sim_bits(q_l, self.rows_L[i], qn_l, self.rules_nL[i]),
+                 _sim_bits(q_r, self.rows_R[i], qn_r, self.rules_nR[i]))
+                for i, score in zip(top, best)]
 
     #knn 
     def predict(self, a, b, top_n=1):
-        scored = self.score_r(a, b)
+        top, best = self._top_rules(a, b)
+        rule_rt_ids = self.rule_rt_ids
 
-        votes = defaultdict(float)
-        for score, rt, _, _ in scored[:self.k]:
-            votes[rt] += score * score
+        votes = [0.0] * len(self.id2rt)
+        for i, score in zip(top, best):
+            votes[rule_rt_ids[i]] += score * score
+        # types dans l'ordre de première apparition : départage des égalités inchangé
+        classes = list(dict.fromkeys(rule_rt_ids[i] for i in top))
 
-        if not votes:
+        if not classes:
             return ("unknown", 0.0) if top_n == 1 else []
 
-        ranked = sorted(votes.items(), key=lambda x: -x[1])
+        classes.sort(key=lambda c: -votes[c])
+        ranked = [(self.id2rt[c], votes[c]) for c in classes]
         if top_n == 1:
             return ranked[0]
         return ranked[:top_n]
 
     #knn pour mode interactif
     def predict_2(self, a, b, top_n=3):
-        scored = self.score_r(a, b)
-
-        votes = defaultdict(lambda: {"score": 0.0, "count": 0, "best_sim_A": 0, "best_sim_B": 0})
-        for score, rt, sim_l, sim_r in scored[:self.k]:
-            votes[rt]["score"] += score
-            votes[rt]["count"] += 1
-            if score > votes[rt].get("best_score", 0):
-                votes[rt]["best_sim_A"] = sim_l
-                votes[rt]["best_sim_B"] = sim_r
-                votes[rt]["best_score"] = score
-
-        type_scores = {}
-        for rt, info in votes.items():
-            type_scores[rt] = {
-                "score": info["score"],
-                "sim_A": info["best_sim_A"],
-                "sim_B": info["best_sim_B"],
-                "votes": info["count"],
-            }
-
-        ranked = sorted(type_scores.items(), key=lambda x: -x[1]["score"])
+        top, best = self._top_rules(a, b)
+        q_l, qn_l, _ = self._query(a)
+        q_r, qn_r, _ = self._query(b)
+        rule_rt_ids = self.rule_rt_ids
+
+        # une case par type de relation (au plus une quinzaine) au lieu d'un dict de dicts
+        n_classes = len(self.id2rt)
+        score_vec = [0.0] * n_classes
+        count_vec = [0] * n_classes
+        best_score = [0] * n_classes
+        best_sim_A = [0] * n_classes
+        best_sim_B = [0] * n_classes
+        for i, score in zip(top, best):
+            c = rule_rt_ids[i]
+            score_vec[c] += score
+            count_vec[c] += 1
+            if score > best_score[c]:
+                best_sim_A[c] = _sim_bits(q_l, self.rows_L[i], qn_l, self.rules_nL[i])
+                best_sim_B[c] = _sim_bits(q_r, self.rows_R[i], qn_r, self.rules_nR[i])
+                best_score[c] = score
+        # types dans l'ordre de première apparition : départage des égalités inchangé
+        classes = list(dict.fromkeys(rule_rt_ids[i] for i in top))
+        classes.sort(key=lambda c: -score_vec[c])
+
+        ranked = [(self.id2rt[c], {
+            "score": score_vec[c],
+            "sim_A": best_sim_A[c],
+            "sim_B": best_sim_B[c],
+            "votes": count_vec[c],
+        }) for c in classes]
         return ranked[:top_n]
@@ -1,99 +1,428 @@
+import asyncio
+import base64
+import functools
 import json
+import mmap
 import os
 import time
 import hashlib
+import http.client
+import threading
 import urllib.error
 import urllib.parse
 import urllib.request
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from config import JDM_API_BASE, API_RATE_LIMIT, API_REQUEST_LIMIT, CACHE_DIR, PREFETCH_CONCURRENCY, MEMORY_CACHE_SIZE, CACHE_MAX_AGE
+from data_loader import json_loads
+
+# msgpack si disponible (binaire, garde les cles int des noeuds), sinon cache JSON
+try:
+    import msgspec
+    _mp_encode = msgspec.msgpack.Encoder().encode
+    _mp_decode = msgspec.msgpack.Decoder().decode
+except ImportError:
+    try:
+        import msgpack
+        _mp_encode = msgpack.packb
+        _mp_decode = functools.partial(msgpack.unpackb, strict_map_key=False)
+    except ImportError:
+        _mp_encode = _mp_decode = None
 
-from config import JDM_API_BASE, API_RATE_LIMIT, API_REQUEST_LIMIT, CACHE_DIR
 # appels D'API avec Cache retry et limite temps d'appel
 # 36 : types_sémantiques 
 # 6 : r_isa
+
+# HTTP/2 (httpx + h2) si disponible : les requetes concurrentes partagent une connexion multiplexee,
+# sinon http.client avec une connexion keep-alive par thread
+try:
+    import httpx
+    import h2  # requis par httpx pour http2=True
+except ImportError:
+    httpx = None
+
+# hote et prefixe de l'API, decoupes une fois pour les connexions persistantes
+_API = urllib.parse.urlsplit(JDM_API_BASE)
+
+# redirections suivies par http.client (urllib le faisait tout seul)
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 5
+
+
+# proxy HTTP(S)_PROXY a utiliser pour l'API : (url du proxy decoupee, en-tetes) ou None
+def _api_proxy():
+    if urllib.request.proxy_bypass(_API.hostname):
+        return None
+    proxy = urllib.request.getproxies().get(_API.scheme)
+    if not proxy:
+        return None
+    if "://" not in proxy:
+        proxy = "http://" + proxy
+    proxy = urllib.parse.urlsplit(proxy)
+    headers = {}
+    if proxy.username:
+        creds = f"{urllib.parse.unquote(proxy.username)}:{urllib.parse.unquote(proxy.password or '')}"
+        headers["Proxy-Authorization"] = "Basic " + base64.b64encode(creds.encode("utf-8")).decode("ascii")
+    return proxy, headers
+
+# archive compactee des fichiers par mot (compact_cache.py) : bout a bout, lus par mmap
+# (les anciens fichiers a plat n'y sont pas copies : ils ne changent pas et resteraient en double)
+ARCHIVE_DATA = "cache.pack"
+ARCHIVE_INDEX = "cache.idx"
+
+
+class CacheArchive:
+    # index : {"words": {md5(mot): [offset, longueur, format]}}
+    def __init__(self, cache_dir):
+        self.words = {}
+        self._mm = None
+        index_path = os.path.join(cache_dir, ARCHIVE_INDEX)
+        data_path = os.path.join(cache_dir, ARCHIVE_DATA)
+        if not (os.path.exists(index_path) and os.path.exists(data_path)):
+            return
+        with open(index_path, "rb") as f:
+            index = json_loads(f.read())
+        self.words = index["words"]
+        if os.path.getsize(data_path):
+            with open(data_path, "rb") as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    # (octets, format) ou None ; une tranche du mmap, sans appel systeme
+    def read(self, key):
+        loc = self.words.get(key)
+        if loc is None:
+            return None
+        offset, length, fmt = loc
+        return self._mm[offset:offset + length], fmt
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+
+# reponse 304 : l'entree en cache est toujours a jour
+NOT_MODIFIED = object()
+# echec (reseau, 5xx, redirection non resolue) : rien a mettre en cache, contrairement a un 404
+API_FAILED = object()
+
+# (types_ids, min_weight) des trois requetes faites pour chaque mot
+# on ne peut pas deduire 6 et 36 de la requete "all" : elle est limitee a API_REQUEST_LIMIT relations
+# tous types confondus (tronquee pour ~87% des mots du corpus, r_isa filtre != r_isa demande pour ~70%)
+PREFETCH_VARIANTS = ((6, 1), (36, 1), (None, 0))
+
+
+# cle d'une requete dans le fichier cache du mot : "6|1", "36|1", "all|0"
+def _variant(types_ids, min_weight):
+    types_str = str(types_ids) if types_ids is not None else "all"
+    return f"{types_str}|{min_weight}"
+
+
+# relations rangees en colonnes (une array par champ) plutot qu'un dict par relation
+def _relation_columns(n1, n2, types, weights):
+    return {
+        "rel_n1": array("q", n1),
+        "rel_n2": array("q", n2),
+        "rel_t": array("i", types),
+        "rel_w": array("d", weights),
+    }
+
+
+# reponse relue du disque -> colonnes ; accepte aussi l'ancien format (liste de dicts "relations")
+def _from_disk(data):
+    rels = data.pop("relations", None)
+    if rels is not None:
+        data.update(_relation_columns(
+            [r["node1"] for r in rels], [r["node2"] for r in rels],
+            [r["type"] for r in rels], [r["weight"] for r in rels]))
+    else:
+        data.update(_relation_columns(data["rel_n1"], data["rel_n2"], data["rel_t"], data["rel_w"]))
+    return data
+
+
+def _to_disk(data):
+    return {
+        "etag": data.get("etag"),
+        "mtime": data.get("mtime", 0),
+        "nodes": data["nodes"],
+        "rel_n1": data["rel_n1"].tolist(),
+        "rel_n2": data["rel_n2"].tolist(),
+        "rel_t": data["rel_t"].tolist(),
+        "rel_w": data["rel_w"].tolist(),
+    }
+
 class JDMClient:
-    def __init__(self, cache_dir=CACHE_DIR):
+    def __init__(self, cache_dir=CACHE_DIR, memory_cache_size=MEMORY_CACHE_SIZE):
         self.cache_dir = cache_dir
-        self._memory_cache = {}
-        self._last_request_time = 0
+        self._memory_cache = OrderedDict()  # mot -> {variante: reponse}, du moins au plus recent
+        self._memory_cache_size = memory_cache_size
+        self._cache_lock = threading.Lock()
+        self.failed_calls = 0  # appels API sans reponse (API_FAILED), protege par _rate_lock
+        self._legacy = None  # plus aucun fichier n'est ecrit a plat : l'index ne change pas
+        self._archive = CacheArchive(cache_dir)
+        self._next_request_time = 0.0  # horloge monotone, protegee par _rate_lock
+        self._rate_lock = threading.Lock()
+        self._local = threading.local()  # une connexion keep-alive par thread (prefetch concurrent)
+        self._proxy = _api_proxy()
+        self._http2 = None
+        if httpx is not None:
+            self._http2 = httpx.Client(
+                base_url=f"{_API.scheme}://{_API.netloc}", http2=True, timeout=30, follow_redirects=True,
+                limits=httpx.Limits(max_keepalive_connections=20))
         os.makedirs(cache_dir, exist_ok=True)
 
-    def _cache_key(self, word, types_ids, min_weight):
-        raw = f"{word}|{types_ids}|{min_weight}"
+    # ancien cache : un fichier JSON a plat par (mot, types, poids)
+    # md5 garde : il nomme les fichiers deja en cache, et sur ces cles courtes il est plus rapide
+    # que blake2b (~670 ns contre ~900 ns) ou qu'un urllib.parse.quote (~2 us)
+    def _cache_key(self, word, variant):
+        raw = f"{word}|{variant}"
         return hashlib.md5(raw.encode("utf-8")).hexdigest()
 
     def _cache_path(self, key):
         return os.path.join(self.cache_dir, f"{key}.json")
 
-    def _load_from_cache(self, key):
-        if key in self._memory_cache:
-            return self._memory_cache[key]
-        path = self._cache_path(key)
-        if os.path.exists(path):
-            with open(path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            if "nodes" in data and isinstance(data["nodes"], dict):
-                data["nodes"] = {int(k): v for k, v in data["nodes"].items()}
-            self._memory_cache[key] = data
-            return data
-        return None
+    # noms des anciens fichiers, lus une fois avec os.scandir : plus de stat par cle dans un dossier de ~35k fichiers
+    def _legacy_names(self):
+        if self._legacy is None:
+            with os.scandir(self.cache_dir) as it:
+                self._legacy = frozenset(e.name for e in it if e.name.endswith(".json") and e.is_file())
+        return self._legacy
 
-    def _save_to_cache(self, key, data):
-        self._memory_cache[key] = data
-        path = self._cache_path(key)
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False)
+    def _load_legacy(self, key):
+        if f"{key}.json" not in self._legacy_names():
+            return None
+        with open(self._cache_path(key), "rb") as f:
+            data = json_loads(f.read())
+        if "nodes" in data and isinstance(data["nodes"], dict):
+            data["nodes"] = {int(k): v for k, v in data["nodes"].items()}
+        return _from_disk(data)
 
+    # un seul fichier par mot (toutes ses requetes), dans un sous-dossier de 2 caracteres
+    def _word_cache_base(self, word):
+        h = hashlib.md5(word.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, h[:2], h)
+
+    def _load_word(self, word):
+        entry = self._memory_cache.get(word)
+        if entry is not None:
+            self._memory_cache.move_to_end(word)
+            return entry
+        # fichier du mot d'abord (ecrit apres la derniere compaction), sinon l'archive
+        base = self._word_cache_base(word)
+        found = None
+        if _mp_decode is not None and os.path.exists(base + ".mp"):
+            with open(base + ".mp", "rb") as f:
+                found = f.read(), "mp"
+        elif os.path.exists(base + ".json"):
+            with open(base + ".json", "rb") as f:
+                found = f.read(), "json"
+        else:
+            found = self._archive.read(os.path.basename(base))
+        entry = {}
+        if found is not None:
+            raw, fmt = found
+            if fmt == "json":
+                entry = json_loads(raw)
+                for data in entry.values():
+                    data["nodes"] = {int(k): v for k, v in data["nodes"].items()}
+            elif _mp_decode is not None:
+                entry = _mp_decode(raw)
+        for data in entry.values():
+            _from_disk(data)
+        self._mem_put(word, entry)
+        return entry
+
+    # LRU : au-dela de la taille max on oublie les mots les moins recemment lus (ils restent sur disque)
+    def _mem_put(self, word, entry):
+        self._memory_cache[word] = entry
+        if len(self._memory_cache) > self._memory_cache_size:
+            self._memory_cache.popitem(last=False)
+
+    # present sur disque, sans rien decoder : fichier du mot ou les trois anciens fichiers a plat
+    def _on_disk(self, word):
+        base = self._word_cache_base(word)
+        if os.path.basename(base) in self._archive.words:
+            return True
+        if os.path.exists(base + ".json") or (_mp_decode is not None and os.path.exists(base + ".mp")):
+            return True
+        legacy = self._legacy_names()
+        return all(
+            f"{self._cache_key(word, _variant(types_ids, min_weight))}.json" in legacy
+            for types_ids, min_weight in PREFETCH_VARIANTS
+        )
+
+    def _load_from_cache(self, word, types_ids, min_weight):
+        variant = _variant(types_ids, min_weight)
+        entry = self._load_word(word)
+        data = entry.get(variant)
+        if data is None:
+            data = self._load_legacy(self._cache_key(word, variant))
+            if data is not None:
+                # sous verrou : _save_to_cache peut etre en train de parcourir la meme entree
+                with self._cache_lock:
+                    data = entry.setdefault(variant, data)
+        return data
+
+    def _save_to_cache(self, word, variant, data):
+        # les requetes d'un meme mot peuvent finir en parallele (prefetch) : on reecrit le fichier sous verrou
+        with self._cache_lock:
+            entry = self._load_word(word)
+            entry[variant] = data
+            on_disk = {v: _to_disk(d) for v, d in entry.items()}
+            base = self._word_cache_base(word)
+            os.makedirs(os.path.dirname(base), exist_ok=True)
+            if _mp_encode is not None:
+                path, payload = base + ".mp", _mp_encode(on_disk)
+            else:
+                path, payload = base + ".json", json.dumps(on_disk, ensure_ascii=False).encode("utf-8")
+            # fichier temporaire + os.replace : un arret en cours d'ecriture ne laisse pas de fichier tronque
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(payload)
+            os.replace(tmp, path)
+
+    # appele depuis plusieurs threads (extraction parallele a l'apprentissage) : chaque appel
+    # reserve son creneau sous verrou puis attend hors verrou, le debit global reste API_RATE_LIMIT
     def _rate_limit(self):
-        elapsed = time.time() - self._last_request_time
-        if elapsed < API_RATE_LIMIT:
-            time.sleep(API_RATE_LIMIT - elapsed)
-        self._last_request_time = time.time()
+        with self._rate_lock:
+            now = time.monotonic()
+            slot = max(now, self._next_request_time)
+            self._next_request_time = slot + API_RATE_LIMIT
+        if slot > now:
+            time.sleep(slot - now)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn_cls = http.client.HTTPSConnection if _API.scheme == "https" else http.client.HTTPConnection
+            if self._proxy is None:
+                conn = conn_cls(_API.netloc, timeout=30)
+            else:
+                # https : tunnel CONNECT par le proxy ; http : requetes en URL absolue au proxy
+                proxy, proxy_headers = self._proxy
+                conn = conn_cls(proxy.hostname, proxy.port, timeout=30)
+                if _API.scheme == "https":
+                    conn.set_tunnel(_API.hostname, _API.port, headers=proxy_headers)
+            self._local.conn = conn
+        return conn
+
+    def _drop_connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # (statut, corps, ETag) d'un GET sur l'API, redirections suivies
+    def _http_get(self, url, headers):
+        if self._http2 is not None:
+            r = self._http2.get(url, headers=headers)
+            return r.status_code, r.content, r.headers.get("ETag")
+        for _ in range(MAX_REDIRECTS):
+            status, body, etag, location = self._keepalive_get(url, headers)
+            if status not in REDIRECT_STATUSES or not location:
+                break
+            target = urllib.parse.urlsplit(urllib.parse.urljoin(f"{_API.scheme}://{_API.netloc}{url}", location))
+            if (target.scheme, target.netloc) != (_API.scheme, _API.netloc):
+                # autre hote : urllib gere la suite (redirections, proxy)
+                return self._urlopen(target.geturl(), headers)
+            url = target.path + (f"?{target.query}" if target.query else "")
+        return status, body, etag
+
+    def _keepalive_get(self, url, headers):
+        reused = getattr(self._local, "conn", None) is not None
+        try:
+            return self._send(self._connection(), url, headers)
+        except ConnectionError:
+            if not reused:
+                raise
+            # connexion gardee ouverte mais fermee par le serveur pendant l'inactivite :
+            # on en rouvre une et on renvoie tout de suite (ni attente ni essai consomme)
+            self._drop_connection()
+            return self._send(self._connection(), url, headers)
+
+    def _send(self, conn, url, headers):
+        if self._proxy is not None and _API.scheme == "http":
+            url = f"http://{_API.netloc}{url}"
+            headers = {**headers, **self._proxy[1]}
+        conn.request("GET", url, headers=headers)
+        response = conn.getresponse()
+        return response.status, response.read(), response.getheader("ETag"), response.getheader("Location")
 
-    def _api_call(self, endpoint, params=None, retries=3):
-        url = f"{JDM_API_BASE}{endpoint}"
+    def _urlopen(self, url, headers):
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=30) as response:
+                return response.status, response.read(), response.headers.get("ETag")
+        except urllib.error.HTTPError as e:
+            # 304, 404... : meme traitement que sur la connexion persistante
+            return e.code, e.read(), e.headers.get("ETag")
+
+    # la connexion est reutilisee d'un appel a l'autre : une seule poignee de main TCP+TLS par thread
+    # etag : revalidation (If-None-Match), renvoie NOT_MODIFIED sur 304
+    # renvoie (donnees, ETag de la reponse) ; donnees : None sur 404, API_FAILED si aucun essai n'aboutit
+    def _api_call(self, endpoint, params=None, retries=3, throttle=True, etag=None):
+        url = f"{_API.path}{endpoint}"
         if params:
             url += "?" + urllib.parse.urlencode(params)
+        headers = {"Accept": "application/json"}
+        if etag:
+            headers["If-None-Match"] = etag
 
         for attempt in range(retries):
-            self._rate_limit()
-
-            req = urllib.request.Request(url)
-            req.add_header("Accept", "application/json")
+            if throttle:
+                self._rate_limit()
 
             try:
-                with urllib.request.urlopen(req, timeout=30) as response:
-                    return json.loads(response.read().decode("utf-8"))
-            except urllib.error.HTTPError as e:
-                if e.code == 404:
-                    return None
-                if attempt < retries - 1:
-                    time.sleep(1.0 * (attempt + 1))
-                    continue
-                return None
+                status, body, response_etag = self._http_get(url, headers)
+                if status == 404:
+                    return None, None
+                if status == 304:
+                    return NOT_MODIFIED, None
+                if status < 300:
+                    return json_loads(body), response_etag
             except Exception:
-                if attempt < retries - 1:
-                    time.sleep(1.0 * (attempt + 1))
-                    continue
-                return None
+                # connexion cassee ou fermee par le serveur : on en rouvre une au prochain essai
+                self._drop_connection()
+            if attempt < retries - 1:
+                time.sleep(1.0 * (attempt + 1))
+        with self._rate_lock:
+            self.failed_calls += 1
+        return API_FAILED, None
 
-    def get_relations(self, word, types_ids=None, min_weight=0, limit=API_REQUEST_LIMIT):
-        types_str = str(types_ids) if types_ids is not None else "all"
-        cache_key = self._cache_key(word, types_str, min_weight)
+    # entree plus vieille que CACHE_MAX_AGE : a revalider (anciens fichiers sans date : toujours)
+    def _is_stale(self, cached):
+        return time.time() - cached.get("mtime", 0) > CACHE_MAX_AGE
 
-        cached = self._load_from_cache(cache_key)
-        if cached is not None:
+    def get_relations(self, word, types_ids=None, min_weight=0, limit=API_REQUEST_LIMIT, revalidate=False):
+        cached = self._load_from_cache(word, types_ids, min_weight)
+        if cached is not None and not (revalidate and self._is_stale(cached)):
             return cached
+        return self._fetch_relations(word, types_ids, min_weight, limit, cached=cached)
 
+    def _fetch_relations(self, word, types_ids, min_weight, limit, throttle=True, cached=None):
         encoded_word = urllib.parse.quote(word, safe="")
         params = {"min_weight": min_weight, "limit": limit}
         if types_ids is not None:
             params["types_ids"] = types_ids
 
-        raw = self._api_call(f"/relations/from/{encoded_word}", params)
+        raw, etag = self._api_call(f"/relations/from/{encoded_word}", params, throttle=throttle,
+                                   etag=cached.get("etag") if cached is not None else None)
 
+        if cached is not None:
+            # revalidation : 304 -> on garde l'entree, echec -> on ne l'ecrase pas par une reponse vide
+            if raw is NOT_MODIFIED:
+                cached["mtime"] = time.time()
+                self._save_to_cache(word, _variant(types_ids, min_weight), cached)
+            if raw is NOT_MODIFIED or raw is None or raw is API_FAILED:
+                return cached
+
+        if raw is API_FAILED:
+            # pas mis en cache : le mot sera redemande au prochain appel
+            return {"nodes": {}, **_relation_columns([], [], [], [])}
         if raw is None:
-            result = {"nodes": {}, "relations": []}
-            self._save_to_cache(cache_key, result)
+            result = {"nodes": {}, **_relation_columns([], [], [], [])}
+            self._save_to_cache(word, _variant(types_ids, min_weight), result)
             return result
 
         nodes = {}
@@ -104,77 +433,109 @@ class JDMClient:
                 "weight": node.get("w", 0),
             }
 
-        relations = []
-        for rel in raw.get("relations", []):
-            relations.append({
-                "node1": rel.get("node1", 0),
-                "node2": rel.get("node2", 0),
-                "type": rel.get("type", 0),
-                "weight": rel.get("w", 0),
-            })
-
-        result = {"nodes": nodes, "relations": relations}
-        self._save_to_cache(cache_key, result)
+        rels = raw.get("relations", [])
+        result = {"etag": etag, "mtime": time.time(), "nodes": nodes, **_relation_columns(
+            [rel.get("node1", 0) for rel in rels],
+            [rel.get("node2", 0) for rel in rels],
+            [rel.get("type", 0) for rel in rels],
+            [rel.get("w", 0) for rel in rels],
+        )}
+        self._save_to_cache(word, _variant(types_ids, min_weight), result)
         return result
     # r_isa
     def get_hyperonyms(self, word):
         data = self.get_relations(word, types_ids=6, min_weight=1)
         nodes = data["nodes"]
         result = {}
-        for rel in data["relations"]:
-            if rel["type"] == 6 and rel["weight"] > 0:
-                node_id = rel["node2"]
-                if node_id in nodes:
-                    result[nodes[node_id]["name"]] = rel["weight"]
+        for node_id, t, w in zip(data["rel_n2"], data["rel_t"], data["rel_w"]):
+            if t == 6 and w > 0 and node_id in nodes:
+                result[nodes[node_id]["name"]] = w
         return result
     # info_sem
     def get_infosem(self, word):
         data = self.get_relations(word, types_ids=36, min_weight=1)
         nodes = data["nodes"]
         result = {}
-        for rel in data["relations"]:
-            if rel["type"] == 36 and rel["weight"] > 0:
-                node_id = rel["node2"]
-                if node_id in nodes:
-                    name = nodes[node_id]["name"]
-                    if name.startswith("_INFO-SEM"):
-                        result[name] = rel["weight"]
+        for node_id, t, w in zip(data["rel_n2"], data["rel_t"], data["rel_w"]):
+            if t == 36 and w > 0 and node_id in nodes:
+                name = nodes[node_id]["name"]
+                if name.startswith("_INFO-SEM"):
+                    result[name] = w
         return result
 
     def get_relation_types_present(self, word):
         data = self.get_relations(word, types_ids=None, min_weight=0)
-        types_present = set()
-        for rel in data["relations"]:
-            if rel["weight"] > 0:
-                types_present.add(rel["type"])
-        return types_present
+        return {t for t, w in zip(data["rel_t"], data["rel_w"]) if w > 0}
 
-    def prefetch_batch(self, words, progress=True):
-        words = list(set(words))
+    # tout ce qu'il faut pour une signature, en un seul appel
+    # (les requetes 6 et 36 restent separees : la reponse "all" est tronquee a API_REQUEST_LIMIT relations)
+    def get_word_bundle(self, word):
+        return {
+            "hyperonyms": self.get_hyperonyms(word),
+            "infosem": self.get_infosem(word),
+            "types_present": self.get_relation_types_present(word),
+        }
+
+    # version asynchrone : le cache est lu tout de suite, seuls les manques passent par l'API
+    async def _aget_relations(self, sem, tokens, word, types_ids, min_weight, revalidate, limit=API_REQUEST_LIMIT):
+        cached = self._load_from_cache(word, types_ids, min_weight)
+        if cached is not None and not (revalidate and self._is_stale(cached)):
+            return cached
+        async with sem:
+            # un jeton par appel : meme debit que _rate_limit, mais les attentes reseau se recouvrent
+            await tokens.get()
+            return await asyncio.to_thread(
+                self._fetch_relations, word, types_ids, min_weight, limit, throttle=False, cached=cached)
+
+    async def _aprefetch(self, words, progress, concurrency, revalidate):
+        # assez de threads pour la concurrence demandee (l'executeur par defaut en a min(32, cpu+4))
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=concurrency))
+        sem = asyncio.Semaphore(concurrency)
+        tokens = asyncio.Queue(maxsize=1)
         total = len(words)
-        fetched = 0
-        cached = 0
+        done = 0
+
+        async def refill():
+            while True:
+                await tokens.put(None)
+                await asyncio.sleep(API_RATE_LIMIT)
 
-        for i, word in enumerate(words):
-            key_isa = self._cache_key(word, "6", 1)
-            key_sem = self._cache_key(word, "36", 1)
-            key_all = self._cache_key(word, "all", 0)
+        async def fetch_word(word):
+            nonlocal done
+            await asyncio.gather(*(
+                self._aget_relations(sem, tokens, word, types_ids, min_weight, revalidate)
+                for types_ids, min_weight in PREFETCH_VARIANTS
+            ))
+            done += 1
+            if progress and done % 50 == 0:
+                print(f"  [{done}/{total}] fetched")
 
-            all_cached = all(
-                self._load_from_cache(k) is not None
-                for k in [key_isa, key_sem, key_all]
-            )
+        refiller = asyncio.create_task(refill())
+        try:
+            await asyncio.gather(*(fetch_word(w) for w in words))
+        finally:
+            refiller.cancel()
+
+    # revalidate : les entrees plus vieilles que CACHE_MAX_AGE sont revalidees (GET conditionnel)
+    def prefetch_batch(self, words, progress=True, concurrency=PREFETCH_CONCURRENCY, revalidate=False):
+        words = list(set(words))
+        total = len(words)
 
-            if all_cached:
-                cached += 1
+        missing = []
+        for word in words:
+            if revalidate:
+                # il faut la date des entrees : on les lit
+                entries = [self._load_from_cache(word, types_ids, min_weight) for types_ids, min_weight in PREFETCH_VARIANTS]
+                all_cached = all(data is not None and not self._is_stale(data) for data in entries)
             else:
-                self.get_relations(word, types_ids=6, min_weight=1)
-                self.get_relations(word, types_ids=36, min_weight=1)
-                self.get_relations(word, types_ids=None, min_weight=0)
-                fetched += 1
+                all_cached = self._on_disk(word)
+            if not all_cached:
+                missing.append(word)
+        fetched = len(missing)
+        cached = total - fetched
 
-            if progress and (i + 1) % 50 == 0:
-                print(f"  [{i+1}/{total}] {fetched} fetched, {cached} cached")
+        if missing:
+            asyncio.run(self._aprefetch(missing, progress, concurrency, revalidate))
 
         if progress:
             print(f"  Prefetch termine : {fetched} fetched, {cached} cached sur {total} mots")
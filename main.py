@@ -1,6 +1,6 @@
 import sys
 import time
-from config import LEARN_DIR, CACHE_DIR, RELATION_LABELS, TRAIN_RATIO
+from config import LEARN_DIR, CACHE_DIR, MODEL_PATH, RELATION_LABELS, TRAIN_RATIO
 from jdm_client import JDMClient
 from signature import SignatureExtractor
 from data_loader import load_corpus, split_train_test, get_all_words
@@ -8,6 +8,21 @@ from grasp_it import GRASPit
 from evaluate import evaluate, confusion_matrix
 import re
 
+# Points de coupure sur "de", "du", "des", "d'", "de la", "de l'", "au", "aux" (compilé une seule fois)
+# Alternatives factorisées par préfixe commun ("d" puis "e"/"'"/"u"...) : le moteur
+# ne réessaie plus chaque alternative depuis le début à chaque espace.
+# Même ordre de priorité que la liste à plat :
+#   de la | de l' | d'un | d'une | d' | du | des | au | aux | de
+SEPARATORS_RE = re.compile(
+    r"\s+("
+    r"d(?:"
+    r"e\s+(?:la\s+|l['']\s*)|"
+    r"['']\s*(?:une?\s+)?|"
+    r"u\s+|es\s+|e\s+"
+    r")|"
+    r"aux?\s+"
+    r")", re.IGNORECASE)
+
 def mot_connu(client, word):
     data = client.get_relations(word)
     return bool(data["nodes"])
@@ -18,18 +33,8 @@ def parse_expression(expr, client):
     if not expr:
         return None, None
 
-    # Trouver tous les points de coupure sur "de", "du", "des", "d'", "de la", "de l'"
-    separators = re.finditer(
-        r"\s+("
-        r"de\s+la\s+|de\s+l['']\s*|"
-        r"d['']\s*un\s+|d['']\s*une\s+|"
-        r"d['']\s*|"
-        r"du\s+|des\s+|"
-        r"au\s+|aux\s+|"
-        r"de\s+"
-        r")", expr, re.IGNORECASE)
     splits = []
-    for m in separators:
+    for m in SEPARATORS_RE.finditer(expr):
         a = expr[:m.start()].strip()
         b = expr[m.end():].strip()
         if a and b:
@@ -97,21 +102,30 @@ def main():
     print("\n 2 Initialisation du client JDM...")
     client = JDMClient(cache_dir=CACHE_DIR)
     extractor = SignatureExtractor(client)
-    print("\n 3 Prefetch des donnees JDM...")
-    all_words = get_all_words(corpus)
-    print(f"  {len(all_words)} mots uniques a charger")
-    start = time.time()
-    client.prefetch_batch(list(all_words), progress=True)
-    prefetch_time = time.time() - start
-    print(f"  Prefetch termine en {prefetch_time:.1f}s")
-
-    # Etape 4 : Apprentissage
-    print("\n 4 Apprentissage GRASP-it...")
     model = GRASPit(extractor)
-    start = time.time()
-    model.train(train)
-    train_time = time.time() - start
-    print(f"  Apprentissage termine en {train_time:.1f}s")
+    prefetch_time = 0.0
+    if model.load(MODEL_PATH, train):
+        print(f"\n 3-4 Modele charge depuis {MODEL_PATH} (prefetch et apprentissage ignores)")
+    else:
+        print("\n 3 Prefetch des donnees JDM...")
+        all_words = get_all_words(corpus)
+        print(f"  {len(all_words)} mots uniques a charger")
+        start = time.time()
+        client.prefetch_batch(list(all_words), progress=True)
+        prefetch_time = time.time() - start
+        print(f"  Prefetch termine en {prefetch_time:.1f}s")
+
+        # Etape 4 : Apprentissage
+        print("\n 4 Apprentissage GRASP-it...")
+        start = time.time()
+        model.train(train)
+        train_time = time.time() - start
+        print(f"  Apprentissage termine en {train_time:.1f}s")
+        # des mots non obtenus de JDM manquent aux règles : on réapprendra au prochain lancement
+        if client.failed_calls:
+            print(f"  {client.failed_calls} appels JDM echoues : modele non sauvegarde")
+        else:
+            model.save(MODEL_PATH, train)
 
     # actuellement cassé
     #Etape 5 : Evaluation
@@ -1,22 +1,31 @@
+import sys
 from dataclasses import dataclass, field
 
 from config import TRT_RELATION_IDS
 
-@dataclass
+# types TRT en ensemble : test d'appartenance sans parcourir la liste de config
+TRT_TYPES = frozenset(TRT_RELATION_IDS)
+
+@dataclass(slots=True)
 class Signature:
     hyperonyms: set = field(default_factory=set)
     trt: set = field(default_factory=set)
     sst: set = field(default_factory=set)
+    _as_frozen: frozenset = field(default=None, init=False, repr=False, compare=False)
 
+    # frozenset : hashable, réutilisable tel quel comme clé de cache par les modèles
+    # construit une seule fois (signature remplie avant le premier appel), symboles internés
     def to_set(self):
-        symbols = set()
-        for h in self.hyperonyms:
-            symbols.add(f"H:{h}")
-        for t in self.trt:
-            symbols.add(f"TRT:{t}")
-        for s in self.sst:
-            symbols.add(f"SST:{s}")
-        return symbols
+        if self._as_frozen is None:
+            symbols = set()
+            for h in self.hyperonyms:
+                symbols.add(sys.intern(f"H:{h}"))
+            for t in self.trt:
+                symbols.add(sys.intern(f"TRT:{t}"))
+            for s in self.sst:
+                symbols.add(sys.intern(f"SST:{s}"))
+            self._as_frozen = frozenset(symbols)
+        return self._as_frozen
 
     def __len__(self):
         return len(self.hyperonyms) + len(self.trt) + len(self.sst)
@@ -29,26 +38,26 @@ class SignatureExtractor:
         self._cache = {}
 
     def extract(self, word):
-        if word in self._cache:
-            return self._cache[word]
+        sig = self._cache.get(word)
+        if sig is not None:
+            return sig
 
         sig = Signature()
+        bundle = self.client.get_word_bundle(word)
 
-        hyp = self.client.get_hyperonyms(word)
+        hyp = bundle["hyperonyms"]
         if hyp:
             top_hyp = sorted(hyp.items(), key=lambda x: -x[1])[:self.max_hyperonyms]
             sig.hyperonyms = {name for name, _ in top_hyp}
 
-        sem = self.client.get_infosem(word)
+        sem = bundle["infosem"]
         sig.sst = set(sem.keys())
-        all_types = self.client.get_relation_types_present(word)
-        sig.trt = {str(t) for t in all_types if t in TRT_RELATION_IDS}
+        all_types = bundle["types_present"]
+        sig.trt = {str(t) for t in all_types if t in TRT_TYPES}
         self._cache[word] = sig
-        
+
         return sig
 
+    # to_set() est mémorisé sur la signature : aucun ensemble reconstruit par paire
     def extract_pair(self, a, b):
-        sig_a = self.extract(a)
-        sig_b = self.extract(b)
-
-        return sig_a.to_set(), sig_b.to_set()
\ No newline at end of file
+        return self.extract(a).to_set(), self.extract(b).to_set()
\ No newline at end of file